@@ -1,16 +1,30 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from passlib.context import CryptContext
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
+import re
+import argparse
+import json
+import time
+import queue
+import random
 import logging
+import logging.handlers
 import asyncio
+import getpass
 import secrets
+import contextvars
 import resend
+from collections import OrderedDict
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from urllib.parse import urlsplit
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, ValidationError, field_validator, model_validator
+from typing import Dict, List, Optional, Set, Tuple
 import uuid
 from datetime import datetime, timezone, timedelta
 
@@ -25,6 +39,18 @@ DB_NAME = os.environ["DB_NAME"]
 ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "saltyfadez2025")
 SENDER_EMAIL = os.environ.get("SENDER_EMAIL", "booking@westcutz.no")
 RESEND_API_KEY = os.environ.get("RESEND_API_KEY")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.05"))
+UTILIZATION_MAX_DAYS = 366
+UTILIZATION_REBUILD_ATTEMPTS = 3
+DEFAULT_TENANT_ID = os.environ.get("DEFAULT_TENANT_ID", "westcutz")
+TENANT_CACHE_TTL = float(os.environ.get("TENANT_CACHE_TTL", "60"))  # seconds
+TENANT_CACHE_SIZE = 512
+TENANT_MISS_CACHE_SIZE = 256
+# bcrypt cost for new shop admin hashes. verify_admin checks the hash on every
+# Basic-auth admin request (in the threadpool), so this stays moderate:
+# 10 rounds is roughly 50-100 ms per check.
+ADMIN_HASH_ROUNDS = 10
 if RESEND_API_KEY:
     resend.api_key = RESEND_API_KEY
 
@@ -37,24 +63,99 @@ db = client[DB_NAME]
 # ----------------------------
 # Logging
 # ----------------------------
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+# Records are handed to a queue from the event loop and formatted/written by a
+# listener thread, so slow stdout or disk never blocks request handling.
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+log_sampled_var: contextvars.ContextVar[bool] = contextvars.ContextVar("log_sampled", default=True)
+
+# Routes polled heavily by the frontend; only LOG_SAMPLE_RATE of their requests log below WARNING.
+SAMPLED_LOG_PATHS = re.compile(r"^/api(/shops/[^/]+)?/time-slots/")
+# Client-supplied X-Request-ID values are only trusted when short and log-safe.
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+_RESERVED_LOG_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_LOG_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class RequestContextQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records without formatting them; only stamps the request context."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING and not log_sampled_var.get():
+            return False
+        return super().filter(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The queue is in-process, so the record (and its exc_info) can be passed
+        # as-is; message interpolation and tracebacks are rendered by the listener.
+        record.request_id = request_id_var.get()
+        return record
+
+def setup_logging() -> logging.handlers.QueueListener:
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(RequestContextQueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+
+    # uvicorn installs its own synchronous stream handlers before importing the
+    # app; send its records through the queue as well. The access log is dropped
+    # because request_context already logs every request (sampled, with request_id).
+    for name in ("uvicorn", "uvicorn.error"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+    access_logger = logging.getLogger("uvicorn.access")
+    access_logger.handlers.clear()
+    access_logger.disabled = True
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+log_listener = setup_logging()
 logger = logging.getLogger(__name__)
 
 # ----------------------------
 # FastAPI app and router
 # ----------------------------
 app = FastAPI(title="WestCutz API")
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter()
 security = HTTPBasic()
 
 # ----------------------------
 # CORS Middleware
 # ----------------------------
+# Hostnames listed by shops in db.shops; kept current by refresh_shop_hosts so a
+# new shop's site is allowed without a redeploy.
+shop_hosts: Set[str] = set()
+
+class ShopCORSMiddleware(CORSMiddleware):
+    def is_allowed_origin(self, origin: str) -> bool:
+        if super().is_allowed_origin(origin):
+            return True
+        parts = urlsplit(origin)
+        return parts.scheme == "https" and parts.hostname in shop_hosts
+
 app.add_middleware(
-    CORSMiddleware,
+    ShopCORSMiddleware,
     allow_credentials=True,
     allow_origins=[
         "https://westcutz.netlify.app",
@@ -64,10 +165,56 @@ app.add_middleware(
     ],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
 # ----------------------------
-# Barber configuration
+# Request correlation
+# ----------------------------
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    request_id = request.headers.get("X-Request-ID", "")
+    if not REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex
+    sampled = not SAMPLED_LOG_PATHS.match(request.url.path) or random.random() < LOG_SAMPLE_RATE
+    request_id_token = request_id_var.set(request_id)
+    sampled_token = log_sampled_var.set(sampled)
+    start = time.perf_counter()
+    try:
+        try:
+            response = await call_next(request)
+        except Exception:
+            # Log while the request context is still set; the traceback would
+            # otherwise only surface later without a request_id.
+            logger.exception(
+                "request failed",
+                extra={
+                    "method": request.method,
+                    "path": request.url.path,
+                    "status": 500,
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                },
+            )
+            raise
+        # This line is the only access log, so failures must survive sampling.
+        logger.log(
+            logging.WARNING if response.status_code >= 400 else logging.INFO,
+            "request",
+            extra={
+                "method": request.method,
+                "path": request.url.path,
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+            },
+        )
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        request_id_var.reset(request_id_token)
+        log_sampled_var.reset(sampled_token)
+
+# ----------------------------
+# Barber configuration (default shop)
 # ----------------------------
 BARBERS = {"marius": "Marius", "sivert": "Sivert"}
 OPENING_HOUR = 9
@@ -79,16 +226,15 @@ BARBER_HOURS = {
     "marius": {"weekday": (OPENING_HOUR, 20), "wednesday": (OPENING_HOUR, 20), "weekend": (OPENING_HOUR, CLOSING_HOUR)},
 }
 
-def get_open_close_hours(barber_id: str, date_str: str) -> tuple[int, int]:
-    barber_id = (barber_id or "marius").lower()
-    cfg = BARBER_HOURS.get(barber_id, BARBER_HOURS["marius"])
+def get_open_close_hours(tenant: "Tenant", barber_id: str, date_str: str) -> tuple[int, int]:
+    cfg = tenant.barber_hours[barber_id]
     d = datetime.strptime(date_str, "%Y-%m-%d")
     wd = d.weekday()
     if wd >= 5:
-        return cfg["weekend"]
+        return cfg.weekend
     if wd == 2:
-        return cfg["wednesday"]
-    return cfg["weekday"]
+        return cfg.wednesday
+    return cfg.weekday
 
 def generate_time_slots(open_hour: int, close_hour: int) -> list[str]:
     slots: list[str] = []
@@ -108,18 +254,19 @@ class BookingCreate(BaseModel):
     customer_name: str
     phone: Optional[str] = None
     email: Optional[EmailStr] = None
-    barber_id: str = "marius"
+    barber_id: Optional[str] = None
     barber_name: Optional[str] = None
     date: str
     time_slot: str
     service_id: Optional[str] = "fade"
     service_name: Optional[str] = "VANLIG KLIPP (FADE)"
-    service_price: Optional[int] = 300
-    service_duration: Optional[int] = 45
+    service_price: Optional[int] = Field(300, ge=0)
+    service_duration: Optional[int] = Field(45, gt=0, le=8 * 60)
 
 class Booking(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    tenant_id: str = DEFAULT_TENANT_ID
     customer_name: str
     phone: Optional[str] = None
     email: Optional[str] = None
@@ -152,11 +299,225 @@ class Absence(BaseModel):
     date: str
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
+class UtilizationRow(BaseModel):
+    barber_id: str
+    date: Optional[str] = None
+    week: Optional[str] = None
+    booked_minutes: int = 0
+    available_minutes: int = 0
+    booked_slots: int = 0
+    total_slots: int = 0
+    # Booked slots counted against capacity: none on absent days, never more
+    # than total_slots. utilization = utilized_slots / total_slots.
+    utilized_slots: int = 0
+    revenue: int = 0
+    cancellations: int = 0
+    absent_days: int = 0
+    utilization: float = 0.0
+
+class UtilizationReport(BaseModel):
+    start: str
+    end: str
+    days: List[UtilizationRow]
+    weeks: List[UtilizationRow]
+
+class BarberHours(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    weekday: Tuple[int, int]
+    wednesday: Tuple[int, int]
+    weekend: Tuple[int, int]
+
+    @field_validator("weekday", "wednesday", "weekend")
+    @classmethod
+    def check_hours(cls, hours: Tuple[int, int]) -> Tuple[int, int]:
+        open_h, close_h = hours
+        if not 0 <= open_h < close_h <= 24:
+            raise ValueError("opening hours must satisfy 0 <= open < close <= 24")
+        return hours
+
+class Tenant(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+    id: str
+    name: str
+    hosts: List[str] = []
+    barbers: Dict[str, str] = Field(min_length=1)
+    barber_hours: Dict[str, BarberHours]
+    sender_email: Optional[str] = None
+    # Output of hash_admin_password(); shops without one reject every admin login.
+    admin_password_hash: Optional[str] = None
+
+    # Shops are looked up by exact match on id and hosts, so both are stored lowercase.
+    @field_validator("id")
+    @classmethod
+    def normalize_id(cls, tenant_id: str) -> str:
+        return tenant_id.strip().lower()
+
+    @field_validator("hosts")
+    @classmethod
+    def normalize_hosts(cls, hosts: List[str]) -> List[str]:
+        return [h.strip().lower() for h in hosts if h.strip()]
+
+    @model_validator(mode="after")
+    def check_barber_hours(self) -> "Tenant":
+        missing = set(self.barbers) - set(self.barber_hours)
+        if missing:
+            raise ValueError(f"barber_hours missing for {sorted(missing)}")
+        return self
+
+# ----------------------------
+# Tenants
+# ----------------------------
+# Shops live in db.shops, so adding one is an insert, not a redeploy. A shop is
+# resolved from the /api/shops/{tenant_id} path prefix, the browser's Origin
+# (the frontend is served from the shop's own domain) or the Host header;
+# anything else falls back to the default shop configured above.
+DEFAULT_TENANT = Tenant(
+    id=DEFAULT_TENANT_ID,
+    name="WestCutz",
+    hosts=["westcutz.netlify.app", "westcutz.no", "www.westcutz.no"],
+    barbers=BARBERS,
+    barber_hours=BARBER_HOURS,
+    sender_email=SENDER_EMAIL,
+)
+
+# Immutable config snapshots keyed by "id:<tenant_id>" / "host:<hostname>". Hits
+# and misses live in separate LRUs so junk hosts or paths can only churn the
+# small miss cache; concurrent misses for one key share a single lookup.
+_tenant_cache: "OrderedDict[str, Tuple[float, Tenant]]" = OrderedDict()
+_tenant_misses: "OrderedDict[str, float]" = OrderedDict()
+_tenant_lookups: Dict[str, "asyncio.Future[Optional[Tenant]]"] = {}
+
+def _remember(cache: OrderedDict, max_size: int, key: str, value) -> None:
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > max_size:
+        cache.popitem(last=False)
+
+async def _fetch_tenant(key: str, field: str, value: str) -> Optional[Tenant]:
+    try:
+        query = {"id": value} if field == "id" else {"hosts": value}
+        doc = await db.shops.find_one(query, {"_id": 0})
+        tenant = None
+        if doc:
+            try:
+                tenant = Tenant(**doc)
+            except ValidationError:
+                logger.exception("Invalid shop config", extra={"tenant_id": doc.get("id")})
+        elif field == "id" and value == DEFAULT_TENANT_ID:
+            tenant = DEFAULT_TENANT
+
+        expires = time.monotonic() + TENANT_CACHE_TTL
+        if tenant:
+            _remember(_tenant_cache, TENANT_CACHE_SIZE, key, (expires, tenant))
+        else:
+            _remember(_tenant_misses, TENANT_MISS_CACHE_SIZE, key, expires)
+        return tenant
+    finally:
+        _tenant_lookups.pop(key, None)
+
+async def load_tenant(field: str, value: str) -> Optional[Tenant]:
+    key = f"{field}:{value}"
+    now = time.monotonic()
+    cached = _tenant_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+    miss_expires = _tenant_misses.get(key)
+    if miss_expires and miss_expires > now:
+        return None
+
+    lookup = _tenant_lookups.get(key)
+    if lookup is None:
+        lookup = asyncio.ensure_future(_fetch_tenant(key, field, value))
+        _tenant_lookups[key] = lookup
+    # shield: one cancelled request must not cancel the lookup others wait on.
+    return await asyncio.shield(lookup)
+
+async def get_tenant(request: Request) -> Tenant:
+    tenant_id = request.path_params.get("tenant_id")
+    if tenant_id:
+        tenant = await load_tenant("id", tenant_id.lower())
+        if not tenant:
+            raise HTTPException(status_code=404, detail="Butikk ikke funnet")
+        return tenant
+
+    origin_host = urlsplit(request.headers.get("origin", "")).hostname
+    host = request.headers.get("host", "").split(":")[0].lower()
+    for candidate in (origin_host, host):
+        if candidate:
+            tenant = await load_tenant("host", candidate)
+            if tenant:
+                return tenant
+    return await load_tenant("id", DEFAULT_TENANT_ID)
+
+def resolve_barber(tenant: Tenant, barber_id: Optional[str]) -> str:
+    """Return barber_id if it belongs to tenant; None means the shop's first barber."""
+    if barber_id is None:
+        return next(iter(tenant.barbers))
+    if barber_id not in tenant.barbers:
+        raise HTTPException(status_code=400, detail="Ukjent frisør")
+    return barber_id
+
+async def save_shop(doc: dict) -> Tenant:
+    """Validate a shop document and store it in its normalized form."""
+    tenant = Tenant(**doc)
+    await db.shops.replace_one({"id": tenant.id}, tenant.model_dump(), upsert=True)
+    for key in [f"id:{tenant.id}", *(f"host:{h}" for h in tenant.hosts)]:
+        _tenant_cache.pop(key, None)
+        _tenant_misses.pop(key, None)
+    return tenant
+
+async def refresh_shop_hosts() -> None:
+    global shop_hosts
+    hosts = set(DEFAULT_TENANT.hosts)
+    async for doc in db.shops.find({}):
+        try:
+            tenant = Tenant(**doc)
+        except ValidationError:
+            logger.exception("Invalid shop config", extra={"tenant_id": doc.get("id")})
+            continue
+        # Shops inserted by hand may carry mixed-case ids/hosts; store the form
+        # load_tenant queries for, so CORS and tenant lookup always agree.
+        if doc.get("id") != tenant.id or doc.get("hosts", []) != tenant.hosts:
+            try:
+                await db.shops.update_one({"_id": doc["_id"]}, {"$set": {"id": tenant.id, "hosts": tenant.hosts}})
+            except DuplicateKeyError:
+                logger.error("Shop id collides after normalizing", extra={"tenant_id": tenant.id})
+                continue
+        hosts.update(tenant.hosts)
+    shop_hosts = hosts
+
+async def refresh_shop_hosts_forever() -> None:
+    while True:
+        try:
+            await refresh_shop_hosts()
+        except Exception:
+            logger.exception("Refreshing shop hosts failed")
+        await asyncio.sleep(TENANT_CACHE_TTL)
+
 # ----------------------------
 # Admin authentication
 # ----------------------------
-def verify_admin(credentials: HTTPBasicCredentials = Depends(security)):
-    correct_password = secrets.compare_digest(credentials.password, ADMIN_PASSWORD)
+admin_password_context = CryptContext(schemes=["bcrypt"])
+
+def hash_admin_password(password: str, rounds: int = ADMIN_HASH_ROUNDS) -> str:
+    return admin_password_context.handler("bcrypt").using(rounds=rounds).hash(password)
+
+def check_admin_password(tenant: Tenant, password: str) -> bool:
+    if not tenant.admin_password_hash:
+        # Only the built-in shop may use ADMIN_PASSWORD; any other shop fails closed.
+        if tenant.id == DEFAULT_TENANT_ID:
+            return secrets.compare_digest(password.encode(), ADMIN_PASSWORD.encode())
+        logger.warning("Shop has no admin_password_hash", extra={"tenant_id": tenant.id})
+        return False
+
+    try:
+        return admin_password_context.verify(password, tenant.admin_password_hash)
+    except ValueError:
+        logger.error("Malformed admin_password_hash", extra={"tenant_id": tenant.id})
+        return False
+
+def verify_admin(credentials: HTTPBasicCredentials = Depends(security), tenant: Tenant = Depends(get_tenant)):
+    correct_password = check_admin_password(tenant, credentials.password)
     if not correct_password:
         raise HTTPException(status_code=401, detail="Feil passord", headers={"WWW-Authenticate": "Basic"})
     return True
@@ -164,9 +525,9 @@ def verify_admin(credentials: HTTPBasicCredentials = Depends(security)):
 # ----------------------------
 # Email sending via Resend (YouTube method)
 # ----------------------------
-async def send_booking_confirmation_email(booking: Booking):
+async def send_booking_confirmation_email(booking: Booking, tenant: Tenant):
     if not booking.email:
-        logger.info("Skipping email: no email provided")
+        logger.info("Skipping email: no email provided", extra={"booking_id": booking.id})
         return
 
     try:
@@ -187,51 +548,172 @@ async def send_booking_confirmation_email(booking: Booking):
           <li><strong>Frisør:</strong> {booking.barber_name}</li>
           <li><strong>Tjeneste:</strong> {booking.service_name} ({booking.service_duration} min)</li>
         </ul>
-        <p>Velkommen til WestCutz ✂️</p>
+        <p>Velkommen til {tenant.name} ✂️</p>
       </body>
     </html>
     """
 
     try:
-        response = resend.Emails.send({
-            "from": SENDER_EMAIL,
+        # resend is a blocking HTTP client; keep it off the event loop.
+        response = await asyncio.to_thread(resend.Emails.send, {
+            "from": tenant.sender_email or SENDER_EMAIL,
             "to": [booking.email],
-            "subject": "Bekreftelse på booking – WestCutz",
+            "subject": f"Bekreftelse på booking – {tenant.name}",
             "html": html_content,
         })
 
-        logger.info(f"Resend response: {response}")
+        logger.info("Confirmation email sent", extra={"booking_id": booking.id, "email_id": response.get("id")})
 
-    except Exception as e:
-        logger.exception("Resend email failed")
+    except Exception:
+        logger.exception("Resend email failed", extra={"booking_id": booking.id})
+
+# ----------------------------
+# Utilization rollups
+# ----------------------------
+# One db.utilization document per (tenant_id, barber_id, date), kept current with
+# $inc on every booking/cancellation so reports never scan db.bookings. Every
+# write also bumps "version", which lets rebuild_utilization detect races.
+UTILIZATION_COUNTERS = ("booked_minutes", "booked_slots", "revenue", "cancellations")
+
+async def bump_utilization(tenant_id: str, barber_id: str, date: str, **inc: int):
+    await db.utilization.update_one(
+        {"tenant_id": tenant_id, "barber_id": barber_id, "date": date},
+        {
+            "$inc": {**inc, "version": 1},
+            "$setOnInsert": {"absent": False, **{k: 0 for k in UTILIZATION_COUNTERS if k not in inc}},
+        },
+        upsert=True,
+    )
+
+async def set_utilization_absent(tenant_id: str, barber_id: str, date: str, absent: bool):
+    await db.utilization.update_one(
+        {"tenant_id": tenant_id, "barber_id": barber_id, "date": date},
+        {
+            "$set": {"absent": absent},
+            "$inc": {"version": 1},
+            "$setOnInsert": {k: 0 for k in UTILIZATION_COUNTERS},
+        },
+        upsert=True,
+    )
+
+async def backfill_tenant_ids():
+    # Documents written before multi-shop support belong to the default shop.
+    for collection in (db.bookings, db.absences):
+        await collection.update_many({"tenant_id": {"$exists": False}}, {"$set": {"tenant_id": DEFAULT_TENANT_ID}})
+
+async def compute_utilization(match: dict) -> Dict[Tuple[str, str, str], dict]:
+    rollups: Dict[Tuple[str, str, str], dict] = {}
+
+    def rollup(key: Tuple[str, str, str]) -> dict:
+        return rollups.setdefault(key, {"absent": False, **{k: 0 for k in UTILIZATION_COUNTERS}})
+
+    active = {"$ne": ["$status", "cancelled"]}
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"tenant_id": "$tenant_id", "barber_id": "$barber_id", "date": "$date"},
+            "booked_minutes": {"$sum": {"$cond": [active, "$service_duration", 0]}},
+            "booked_slots": {"$sum": {"$cond": [active, 1, 0]}},
+            "revenue": {"$sum": {"$cond": [active, "$service_price", 0]}},
+            "cancellations": {"$sum": {"$cond": [active, 0, 1]}},
+        }},
+    ]
+    async for row in db.bookings.aggregate(pipeline):
+        key = (row["_id"]["tenant_id"], row["_id"]["barber_id"], row["_id"]["date"])
+        rollup(key).update({k: row[k] for k in UTILIZATION_COUNTERS})
+
+    async for absence in db.absences.find(match, {"_id": 0, "tenant_id": 1, "barber_id": 1, "date": 1}):
+        rollup((absence["tenant_id"], absence["barber_id"], absence["date"]))["absent"] = True
+    return rollups
+
+async def rebuild_utilization(tenant_id: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None) -> int:
+    """Recompute rollups from db.bookings and db.absences to repair drift.
+
+    A rollup is only overwritten or deleted if its version is unchanged since
+    before the recount; keys hit by a concurrent $inc are recounted on the next
+    pass. This is not fully safe under live traffic: create_booking and
+    cancel_booking write the booking before their $inc, so a recount landing
+    between the two counts that booking and the late $inc counts it again.
+    Rebuild ranges that are not being booked, or rerun it afterwards.
+    """
+    await backfill_tenant_ids()
+
+    match: dict = {}
+    if tenant_id:
+        match["tenant_id"] = tenant_id
+    if start or end:
+        match["date"] = {}
+        if start:
+            match["date"]["$gte"] = start
+        if end:
+            match["date"]["$lte"] = end
+
+    repaired = 0
+    for _attempt in range(UTILIZATION_REBUILD_ATTEMPTS):
+        versions = {
+            (d["tenant_id"], d["barber_id"], d["date"]): d.get("version")
+            async for d in db.utilization.find(match, {"_id": 0, "tenant_id": 1, "barber_id": 1, "date": 1, "version": 1})
+        }
+        rollups = await compute_utilization(match)
+
+        conflicts: List[Tuple[str, str, str]] = []
+        for key in versions.keys() | rollups.keys():
+            t, b, d = key
+            unchanged = {"tenant_id": t, "barber_id": b, "date": d}
+            unchanged["version"] = versions[key] if key in versions else {"$exists": False}
+            try:
+                if key in rollups:
+                    result = await db.utilization.update_one(
+                        unchanged,
+                        {"$set": rollups[key], "$inc": {"version": 1}},
+                        upsert=key not in versions,
+                    )
+                    written = result.matched_count or result.upserted_id is not None
+                else:
+                    # No bookings or absence left for this day: the rollup is stale.
+                    written = (await db.utilization.delete_one(unchanged)).deleted_count
+            except DuplicateKeyError:
+                written = False
+            if written:
+                repaired += 1
+            else:
+                conflicts.append(key)
+
+        if not conflicts:
+            return repaired
+        match = {"$or": [{"tenant_id": t, "barber_id": b, "date": d} for t, b, d in conflicts]}
+
+    logger.warning("Utilization rebuild left rollups unrepaired", extra={"rollups": len(conflicts)})
+    return repaired
 
 # ----------------------------
 # API Endpoints
 # ----------------------------
 @api_router.get("/")
-async def root():
-    return {"message": "WestCutz API"}
+async def root(tenant: Tenant = Depends(get_tenant)):
+    return {"message": f"{tenant.name} API"}
 
 @api_router.get("/barbers")
-async def list_barbers():
-    return [{"id": bid, "name": name} for bid, name in BARBERS.items()]
+async def list_barbers(tenant: Tenant = Depends(get_tenant)):
+    return [{"id": bid, "name": name} for bid, name in tenant.barbers.items()]
 
 @api_router.get("/time-slots/{date}", response_model=List[TimeSlot])
-async def get_available_time_slots(date: str, barber_id: str = "marius"):
+async def get_available_time_slots(date: str, barber_id: Optional[str] = None, tenant: Tenant = Depends(get_tenant)):
     try:
         booking_date = datetime.strptime(date, "%Y-%m-%d").date()
     except ValueError:
         raise HTTPException(status_code=400, detail="Ugyldig datoformat. Bruk YYYY-MM-DD")
+    barber_id = resolve_barber(tenant, barber_id)
 
-    absence = await db.absences.find_one({"barber_id": barber_id, "date": date})
+    absence = await db.absences.find_one({"tenant_id": tenant.id, "barber_id": barber_id, "date": date})
     if absence:
         return []
 
-    open_h, close_h = get_open_close_hours(barber_id, date)
+    open_h, close_h = get_open_close_hours(tenant, barber_id, date)
     all_slots = generate_time_slots(open_h, close_h)
 
     existing_bookings = await db.bookings.find(
-        {"date": date, "status": {"$ne": "cancelled"}, "barber_id": barber_id},
+        {"tenant_id": tenant.id, "barber_id": barber_id, "date": date, "status": {"$ne": "cancelled"}},
         {"_id": 0, "time_slot": 1},
     ).to_list(100)
     booked_times = {b["time_slot"] for b in existing_bookings}
@@ -246,7 +728,7 @@ async def get_available_time_slots(date: str, barber_id: str = "marius"):
     return [TimeSlot(time=s, available=(s not in booked_times)) for s in all_slots]
 
 @api_router.post("/bookings", response_model=Booking)
-async def create_booking(booking_data: BookingCreate):
+async def create_booking(booking_data: BookingCreate, tenant: Tenant = Depends(get_tenant)):
     if not booking_data.phone and not booking_data.email:
         raise HTTPException(status_code=400, detail="Vennligst oppgi telefon eller e-post")
 
@@ -256,31 +738,38 @@ async def create_booking(booking_data: BookingCreate):
             raise HTTPException(status_code=400, detail="Kan ikke booke tid i fortiden")
     except ValueError:
         raise HTTPException(status_code=400, detail="Ugyldig datoformat. Bruk YYYY-MM-DD")
+    booking_data.barber_id = resolve_barber(tenant, booking_data.barber_id)
 
-    absence = await db.absences.find_one({"barber_id": booking_data.barber_id, "date": booking_data.date})
+    absence = await db.absences.find_one({
+        "tenant_id": tenant.id,
+        "barber_id": booking_data.barber_id,
+        "date": booking_data.date,
+    })
     if absence:
         raise HTTPException(status_code=400, detail="Frisøren er ikke tilgjengelig denne dagen")
 
-    open_h, close_h = get_open_close_hours(booking_data.barber_id, booking_data.date)
+    open_h, close_h = get_open_close_hours(tenant, booking_data.barber_id, booking_data.date)
     valid_slots = set(generate_time_slots(open_h, close_h))
     if booking_data.time_slot not in valid_slots:
         raise HTTPException(status_code=400, detail="Tiden er ikke tilgjengelig")
 
     existing = await db.bookings.find_one({
+        "tenant_id": tenant.id,
+        "barber_id": booking_data.barber_id,
         "date": booking_data.date,
         "time_slot": booking_data.time_slot,
-        "barber_id": booking_data.barber_id,
         "status": {"$ne": "cancelled"}
     })
     if existing:
         raise HTTPException(status_code=400, detail="Denne tiden er allerede booket")
 
     booking = Booking(
+        tenant_id=tenant.id,
         customer_name=booking_data.customer_name,
         phone=booking_data.phone,
         email=booking_data.email,
         barber_id=booking_data.barber_id,
-        barber_name=BARBERS.get(booking_data.barber_id, booking_data.barber_id),
+        barber_name=tenant.barbers[booking_data.barber_id],
         date=booking_data.date,
         time_slot=booking_data.time_slot,
         service_id=booking_data.service_id,
@@ -290,12 +779,20 @@ async def create_booking(booking_data: BookingCreate):
     )
 
     await db.bookings.insert_one(booking.model_dump())
-    asyncio.create_task(send_booking_confirmation_email(booking))
+    await bump_utilization(
+        tenant.id, booking.barber_id, booking.date,
+        booked_minutes=booking.service_duration, booked_slots=1, revenue=booking.service_price,
+    )
+    logger.info("Booking created", extra={
+        "tenant_id": tenant.id, "booking_id": booking.id, "barber_id": booking.barber_id, "date": booking.date,
+    })
+    # create_task copies the current context, so the email logs keep this request_id.
+    asyncio.create_task(send_booking_confirmation_email(booking, tenant))
     return booking
 
 @api_router.get("/bookings", response_model=List[Booking])
-async def get_bookings(date: Optional[str] = None, barber_id: Optional[str] = None):
-    query = {"status": {"$ne": "cancelled"}}
+async def get_bookings(date: Optional[str] = None, barber_id: Optional[str] = None, tenant: Tenant = Depends(get_tenant)):
+    query = {"tenant_id": tenant.id, "status": {"$ne": "cancelled"}}
     if date:
         query["date"] = date
     if barber_id:
@@ -304,39 +801,169 @@ async def get_bookings(date: Optional[str] = None, barber_id: Optional[str] = No
     return bookings
 
 @api_router.get("/bookings/{booking_id}", response_model=Booking)
-async def get_booking(booking_id: str):
-    booking = await db.bookings.find_one({"id": booking_id}, {"_id": 0})
+async def get_booking(booking_id: str, tenant: Tenant = Depends(get_tenant)):
+    booking = await db.bookings.find_one({"tenant_id": tenant.id, "id": booking_id}, {"_id": 0})
     if not booking:
         raise HTTPException(status_code=404, detail="Bestilling ikke funnet")
     return booking
 
 @api_router.delete("/bookings/{booking_id}")
-async def cancel_booking(booking_id: str):
-    result = await db.bookings.update_one({"id": booking_id}, {"$set": {"status": "cancelled"}})
-    if result.matched_count == 0:
+async def cancel_booking(booking_id: str, tenant: Tenant = Depends(get_tenant)):
+    # Only the request that actually flips the status adjusts the rollup.
+    previous = await db.bookings.find_one_and_update(
+        {"tenant_id": tenant.id, "id": booking_id, "status": {"$ne": "cancelled"}},
+        {"$set": {"status": "cancelled"}},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if previous:
+        booking = Booking(**previous)
+        await bump_utilization(
+            tenant.id, booking.barber_id, booking.date,
+            booked_minutes=-booking.service_duration, booked_slots=-1,
+            revenue=-booking.service_price, cancellations=1,
+        )
+    elif not await db.bookings.find_one({"tenant_id": tenant.id, "id": booking_id}, {"_id": 1}):
         raise HTTPException(status_code=404, detail="Bestilling ikke funnet")
+    logger.info("Booking cancelled", extra={"tenant_id": tenant.id, "booking_id": booking_id})
     return {"message": "Bestilling kansellert"}
 
 @api_router.post("/admin/login")
-async def admin_login(login: AdminLogin):
-    if secrets.compare_digest(login.password, ADMIN_PASSWORD):
+async def admin_login(login: AdminLogin, tenant: Tenant = Depends(get_tenant)):
+    # bcrypt is deliberately slow; keep it off the event loop.
+    if await asyncio.to_thread(check_admin_password, tenant, login.password):
         return {"success": True, "message": "Innlogget"}
     raise HTTPException(status_code=401, detail="Feil passord")
 
 @api_router.post("/admin/absence")
-async def toggle_absence(data: Absence, _: bool = Depends(verify_admin)):
-    existing = await db.absences.find_one({"barber_id": data.barber_id, "date": data.date})
+async def toggle_absence(data: Absence, tenant: Tenant = Depends(get_tenant), _: bool = Depends(verify_admin)):
+    resolve_barber(tenant, data.barber_id)
+    existing = await db.absences.find_one({"tenant_id": tenant.id, "barber_id": data.barber_id, "date": data.date})
     if existing:
         await db.absences.delete_one({"_id": existing["_id"]})
+        await set_utilization_absent(tenant.id, data.barber_id, data.date, False)
+        logger.info("Absence removed", extra={"tenant_id": tenant.id, "barber_id": data.barber_id, "date": data.date})
         return {"status": "removed"}
     else:
-        await db.absences.insert_one(data.model_dump())
+        await db.absences.insert_one({**data.model_dump(), "tenant_id": tenant.id})
+        await set_utilization_absent(tenant.id, data.barber_id, data.date, True)
+        logger.info("Absence added", extra={"tenant_id": tenant.id, "barber_id": data.barber_id, "date": data.date})
         return {"status": "added"}
 
+@api_router.get("/admin/utilization", response_model=UtilizationReport)
+async def get_utilization(
+    start: str,
+    end: str,
+    barber_id: Optional[str] = None,
+    tenant: Tenant = Depends(get_tenant),
+    _: bool = Depends(verify_admin),
+):
+    try:
+        start_date = datetime.strptime(start, "%Y-%m-%d").date()
+        end_date = datetime.strptime(end, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Ugyldig datoformat. Bruk YYYY-MM-DD")
+    num_days = (end_date - start_date).days + 1
+    if num_days < 1 or num_days > UTILIZATION_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Periode må være mellom 1 og {UTILIZATION_MAX_DAYS} dager")
+
+    # strptime accepts unpadded dates like 2026-10-5; query with the canonical form
+    # stored on rollups so string comparison matches the days iterated below.
+    start, end = start_date.isoformat(), end_date.isoformat()
+    query = {"tenant_id": tenant.id, "date": {"$gte": start, "$lte": end}}
+    if barber_id:
+        query["barber_id"] = resolve_barber(tenant, barber_id)
+    docs = await db.utilization.find(query, {"_id": 0}).to_list(None)
+    rollups = {(d["barber_id"], d["date"]): d for d in docs}
+
+    barber_ids = [barber_id] if barber_id else list(tenant.barbers)
+    days: List[UtilizationRow] = []
+    weeks: Dict[Tuple[str, str], UtilizationRow] = {}
+    for offset in range(num_days):
+        day = start_date + timedelta(days=offset)
+        date_str = day.isoformat()
+        iso_year, iso_week, _weekday = day.isocalendar()
+        for bid in barber_ids:
+            r = rollups.get((bid, date_str), {})
+            absent = r.get("absent", False)
+            total_slots = 0 if absent else len(generate_time_slots(*get_open_close_hours(tenant, bid, date_str)))
+            row = UtilizationRow(
+                barber_id=bid,
+                date=date_str,
+                booked_minutes=r.get("booked_minutes", 0),
+                available_minutes=total_slots * SLOT_DURATION,
+                booked_slots=r.get("booked_slots", 0),
+                total_slots=total_slots,
+                utilized_slots=min(r.get("booked_slots", 0), total_slots),
+                revenue=r.get("revenue", 0),
+                cancellations=r.get("cancellations", 0),
+                absent_days=int(absent),
+            )
+            days.append(row)
+
+            week = weeks.setdefault(
+                (bid, f"{iso_year}-W{iso_week:02d}"),
+                UtilizationRow(barber_id=bid, week=f"{iso_year}-W{iso_week:02d}"),
+            )
+            for field in ("booked_minutes", "available_minutes", "booked_slots", "total_slots",
+                          "utilized_slots", "revenue", "cancellations", "absent_days"):
+                setattr(week, field, getattr(week, field) + getattr(row, field))
+
+    for row in [*days, *weeks.values()]:
+        if row.total_slots:
+            row.utilization = round(row.utilized_slots / row.total_slots, 4)
+    return UtilizationReport(start=start, end=end, days=days, weeks=list(weeks.values()))
+
 # ----------------------------
 # Include router at the END
 # ----------------------------
-app.include_router(api_router)
+app.include_router(api_router, prefix="/api")
+app.include_router(api_router, prefix="/api/shops/{tenant_id}")
+
+# ----------------------------
+# Indexes
+# ----------------------------
+@app.on_event("startup")
+async def ensure_indexes():
+    await backfill_tenant_ids()
+
+    # Every hot query leads with tenant_id, so each shop only scans its own keys.
+    await db.bookings.create_index([("tenant_id", 1), ("barber_id", 1), ("date", 1), ("time_slot", 1)])
+    await db.bookings.create_index([("tenant_id", 1), ("date", 1)])
+    await db.bookings.create_index([("tenant_id", 1), ("id", 1)])
+    await db.absences.create_index([("tenant_id", 1), ("barber_id", 1), ("date", 1)])
+    await db.utilization.create_index([("tenant_id", 1), ("barber_id", 1), ("date", 1)], unique=True)
+    await db.utilization.create_index([("tenant_id", 1), ("date", 1)])
+    await db.shops.create_index("id", unique=True)
+    await db.shops.create_index("hosts")
+
+    # Seed rollups from existing bookings once per database, so reports and $inc
+    # on pre-existing bookings start from correct totals. The marker is claimed
+    # atomically, so only the first worker to start ever runs the full scan.
+    try:
+        await db.migrations.insert_one({"_id": "utilization_seed", "started_at": datetime.now(timezone.utc).isoformat()})
+    except DuplicateKeyError:
+        return
+    count = await rebuild_utilization()
+    await db.migrations.update_one(
+        {"_id": "utilization_seed"},
+        {"$set": {"finished_at": datetime.now(timezone.utc).isoformat(), "rollups": count}},
+    )
+    logger.info("Utilization seeded", extra={"rollups": count})
+
+# ----------------------------
+# Shop hosts (CORS allow-list)
+# ----------------------------
+shop_hosts_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_shop_hosts_refresh():
+    global shop_hosts_task
+    shop_hosts_task = asyncio.create_task(refresh_shop_hosts_forever())
+
+@app.on_event("shutdown")
+async def stop_shop_hosts_refresh():
+    if shop_hosts_task:
+        shop_hosts_task.cancel()
 
 # ----------------------------
 # Shutdown database
@@ -344,3 +971,35 @@ app.include_router(api_router)
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+
+@app.on_event("shutdown")
+async def shutdown_logging():
+    log_listener.stop()
+
+# ----------------------------
+# Maintenance commands
+# ----------------------------
+# python server.py rebuild-utilization [--tenant ID] [--start YYYY-MM-DD] [--end YYYY-MM-DD]
+# python server.py hash-password   (prints an admin_password_hash for a db.shops document)
+# python server.py add-shop shop.json   (validates and stores a db.shops document)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="WestCutz maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild = commands.add_parser("rebuild-utilization", help="Recompute utilization rollups from bookings")
+    rebuild.add_argument("--tenant")
+    rebuild.add_argument("--start")
+    rebuild.add_argument("--end")
+    commands.add_parser("hash-password", help="Hash a shop admin password for db.shops")
+    add_shop = commands.add_parser("add-shop", help="Validate and store a shop from a JSON file")
+    add_shop.add_argument("file", type=Path)
+    args = parser.parse_args()
+
+    if args.command == "rebuild-utilization":
+        count = asyncio.run(rebuild_utilization(args.tenant, args.start, args.end))
+        logger.info("Utilization rebuilt", extra={"tenant_id": args.tenant, "rollups": count})
+    elif args.command == "hash-password":
+        print(hash_admin_password(getpass.getpass("Admin password: ")))
+    elif args.command == "add-shop":
+        tenant = asyncio.run(save_shop(json.loads(args.file.read_text())))
+        logger.info("Shop saved", extra={"tenant_id": tenant.id, "hosts": tenant.hosts})
+    log_listener.stop()
@@ -0,0 +1,60 @@
+import asyncio
+import os
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "westcutz_test")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+import server  # noqa: E402
+
+ADMIN_PASSWORD = server.ADMIN_PASSWORD
+NORDCUT_PASSWORD = "nordcut-secret"
+
+@pytest.fixture
+def db(monkeypatch):
+    mock_db = AsyncMongoMockClient()["westcutz_test"]
+    monkeypatch.setattr(server, "db", mock_db)
+    server._tenant_cache.clear()
+    server._tenant_misses.clear()
+    asyncio.run(server.ensure_indexes())
+    return mock_db
+
+@pytest.fixture
+def nordcut(db):
+    """A second shop on its own domain, with its own barber and admin password."""
+    shop = {
+        "id": "nordcut",
+        "name": "NordCut",
+        "hosts": ["nordcut.no"],
+        "barbers": {"ola": "Ola"},
+        "barber_hours": {"ola": {"weekday": [9, 17], "wednesday": [9, 17], "weekend": [9, 17]}},
+        "admin_password_hash": server.hash_admin_password(NORDCUT_PASSWORD, rounds=4),
+    }
+    asyncio.run(db.shops.insert_one(dict(shop)))
+    asyncio.run(server.refresh_shop_hosts())
+    return shop
+
+@pytest.fixture
+def client(db):
+    return TestClient(server.app)
+
+@pytest.fixture
+def booking_date():
+    return (date.today() + timedelta(days=7)).isoformat()
+
+def book(client, booking_date, barber_id="marius", time_slot="09:00", prefix="/api", headers=None, **fields):
+    return client.post(f"{prefix}/bookings", headers=headers, json={
+        "customer_name": "Kari",
+        "phone": "12345678",
+        "barber_id": barber_id,
+        "date": booking_date,
+        "time_slot": time_slot,
+        **fields,
+    })
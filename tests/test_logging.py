@@ -0,0 +1,96 @@
+import asyncio
+import json
+import logging
+import queue
+import sys
+
+import server
+
+
+def request_records(caplog):
+    return [r for r in caplog.records if r.name == "server" and r.getMessage() == "request"]
+
+
+def test_valid_request_id_is_echoed(client):
+    response = client.get("/api/", headers={"X-Request-ID": "abc-123.x_y"})
+    assert response.headers["X-Request-ID"] == "abc-123.x_y"
+
+
+def test_invalid_request_id_is_replaced(client):
+    for bad in ("a" * 65, "bad id\n{}", ""):
+        response = client.get("/api/", headers={"X-Request-ID": bad})
+        assert response.headers["X-Request-ID"] != bad
+        assert server.REQUEST_ID_PATTERN.match(response.headers["X-Request-ID"])
+
+
+def test_request_line_carries_request_id(client, caplog):
+    caplog.set_level(logging.INFO)
+    client.get("/api/barbers", headers={"X-Request-ID": "req-1"})
+
+    [record] = request_records(caplog)
+    assert record.request_id == "req-1"
+    assert (record.method, record.path, record.status) == ("GET", "/api/barbers", 200)
+
+
+def test_failed_time_slot_request_logged_at_warning(client, caplog, monkeypatch):
+    monkeypatch.setattr(server, "LOG_SAMPLE_RATE", 0.0)
+    caplog.set_level(logging.INFO)
+    client.get("/api/time-slots/not-a-date")
+
+    [record] = request_records(caplog)
+    assert record.status == 400
+    assert record.levelno == logging.WARNING
+
+
+def test_unsampled_requests_drop_info_but_keep_warnings():
+    log_queue = queue.SimpleQueue()
+    handler = server.RequestContextQueueHandler(log_queue)
+    info = logging.LogRecord("server", logging.INFO, __file__, 1, "info", None, None)
+    warning = logging.LogRecord("server", logging.WARNING, __file__, 1, "warning", None, None)
+
+    token = server.log_sampled_var.set(False)
+    try:
+        handler.handle(info)
+        handler.handle(warning)
+    finally:
+        server.log_sampled_var.reset(token)
+
+    assert log_queue.get_nowait().getMessage() == "warning"
+    assert log_queue.empty()
+
+
+def test_json_formatter_output():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = logging.LogRecord("server", logging.ERROR, __file__, 1, "failed %s", ("booking",), None)
+        record.exc_info = sys.exc_info()
+    record.request_id = "req-2"
+    record.booking_id = "b-1"
+
+    entry = json.loads(server.JsonFormatter().format(record))
+    assert entry["level"] == "ERROR"
+    assert entry["msg"] == "failed booking"
+    assert entry["request_id"] == "req-2"
+    assert entry["booking_id"] == "b-1"
+    assert "ValueError: boom" in entry["exc"]
+
+
+def test_request_id_reaches_email_task(db, caplog, monkeypatch, booking_date):
+    caplog.set_level(logging.INFO)
+    monkeypatch.setattr(server.resend.Emails, "send", lambda params: {"id": "email-1"})
+
+    async def create():
+        server.request_id_var.set("req-email")
+        booking = server.BookingCreate(
+            customer_name="Kari", email="kari@example.com", barber_id="marius",
+            date=booking_date, time_slot="09:00",
+        )
+        await server.create_booking(booking, server.DEFAULT_TENANT)
+        pending = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        await asyncio.gather(*pending)
+
+    asyncio.run(create())
+    [record] = [r for r in caplog.records if r.getMessage() == "Confirmation email sent"]
+    assert record.request_id == "req-email"
+    assert record.email_id == "email-1"
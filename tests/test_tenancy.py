@@ -0,0 +1,126 @@
+import asyncio
+
+import server
+
+from .conftest import ADMIN_PASSWORD, NORDCUT_PASSWORD, book
+
+
+def test_booking_not_visible_from_other_shop(client, nordcut, booking_date):
+    assert book(client, booking_date).status_code == 200
+
+    assert len(client.get("/api/bookings").json()) == 1
+    assert client.get("/api/shops/nordcut/bookings").json() == []
+    assert client.get("/api/bookings", headers={"Origin": "https://nordcut.no"}).json() == []
+
+
+def test_same_slot_bookable_in_each_shop(client, nordcut, booking_date):
+    westcutz = book(client, booking_date)
+    nordcut_booking = book(client, booking_date, "ola", prefix="/api/shops/nordcut")
+
+    assert westcutz.json()["tenant_id"] == "westcutz"
+    assert nordcut_booking.json()["tenant_id"] == "nordcut"
+    booking_id = westcutz.json()["id"]
+    assert client.get(f"/api/shops/nordcut/bookings/{booking_id}").status_code == 404
+    assert client.delete(f"/api/shops/nordcut/bookings/{booking_id}").status_code == 404
+
+
+def test_absence_scoped_to_shop(client, nordcut, booking_date):
+    response = client.post(
+        "/api/shops/nordcut/admin/absence",
+        json={"barber_id": "ola", "date": booking_date},
+        auth=("admin", NORDCUT_PASSWORD),
+    )
+    assert response.json() == {"status": "added"}
+
+    assert client.get(f"/api/shops/nordcut/time-slots/{booking_date}", params={"barber_id": "ola"}).json() == []
+    assert client.get(f"/api/time-slots/{booking_date}", params={"barber_id": "marius"}).json() != []
+
+
+def test_shop_admin_rejects_global_password(client, nordcut):
+    assert client.post("/api/shops/nordcut/admin/login", json={"password": ADMIN_PASSWORD}).status_code == 401
+    assert client.post("/api/shops/nordcut/admin/login", json={"password": NORDCUT_PASSWORD}).status_code == 200
+    assert client.post("/api/admin/login", json={"password": NORDCUT_PASSWORD}).status_code == 401
+    assert client.post("/api/admin/login", json={"password": ADMIN_PASSWORD}).status_code == 200
+
+
+def test_shop_without_password_hash_fails_closed(client, db, booking_date):
+    asyncio.run(db.shops.insert_one({
+        "id": "openshop",
+        "name": "Open",
+        "barbers": {"per": "Per"},
+        "barber_hours": {"per": {"weekday": [9, 17], "wednesday": [9, 17], "weekend": [9, 17]}},
+    }))
+
+    assert client.post("/api/shops/openshop/admin/login", json={"password": ADMIN_PASSWORD}).status_code == 401
+    response = client.post(
+        "/api/shops/openshop/admin/absence",
+        json={"barber_id": "per", "date": booking_date},
+        auth=("admin", ADMIN_PASSWORD),
+    )
+    assert response.status_code == 401
+
+
+def test_unknown_barber_rejected(client, nordcut, booking_date):
+    assert book(client, booking_date, "marius", prefix="/api/shops/nordcut").status_code == 400
+    response = client.get(f"/api/shops/nordcut/time-slots/{booking_date}", params={"barber_id": "marius"})
+    assert response.status_code == 400
+
+
+def test_invalid_shop_config_is_not_found(client, db):
+    asyncio.run(db.shops.insert_one({"id": "broken", "name": "Broken", "barbers": {}, "barber_hours": {}}))
+
+    assert client.get("/api/shops/broken/barbers").status_code == 404
+
+
+def test_cors_allows_shop_origin(client, nordcut):
+    response = client.options("/api/bookings", headers={
+        "Origin": "https://nordcut.no",
+        "Access-Control-Request-Method": "POST",
+    })
+    assert response.headers["access-control-allow-origin"] == "https://nordcut.no"
+
+    response = client.options("/api/bookings", headers={
+        "Origin": "https://evil.example",
+        "Access-Control-Request-Method": "POST",
+    })
+    assert "access-control-allow-origin" not in response.headers
+
+
+def test_mixed_case_shop_hosts_and_id_are_normalized(client, db):
+    asyncio.run(db.shops.insert_one({
+        "id": "UpShop",
+        "name": "Up",
+        "hosts": [" Up.NO "],
+        "barbers": {"per": "Per"},
+        "barber_hours": {"per": {"weekday": [9, 17], "wednesday": [9, 17], "weekend": [9, 17]}},
+    }))
+    asyncio.run(server.refresh_shop_hosts())
+
+    assert client.get("/api/barbers", headers={"Origin": "https://up.no"}).json() == [{"id": "per", "name": "Per"}]
+    assert client.get("/api/shops/upshop/barbers").status_code == 200
+
+
+def test_save_shop_stores_normalized_form(client, db):
+    asyncio.run(server.save_shop({
+        "id": "UpShop",
+        "name": "Up",
+        "hosts": ["Up.NO"],
+        "barbers": {"per": "Per"},
+        "barber_hours": {"per": {"weekday": [9, 17], "wednesday": [9, 17], "weekend": [9, 17]}},
+    }))
+
+    doc = asyncio.run(db.shops.find_one({"id": "upshop"}))
+    assert doc["hosts"] == ["up.no"]
+    assert client.get("/api/barbers", headers={"Host": "up.no"}).json() == [{"id": "per", "name": "Per"}]
+
+
+def test_malformed_password_hash_rejected(client, db):
+    asyncio.run(db.shops.insert_one({
+        "id": "badhash",
+        "name": "Bad",
+        "barbers": {"per": "Per"},
+        "barber_hours": {"per": {"weekday": [9, 17], "wednesday": [9, 17], "weekend": [9, 17]}},
+        "admin_password_hash": "not-a-hash",
+    }))
+
+    assert client.post("/api/shops/badhash/admin/login", json={"password": "not-a-hash"}).status_code == 401
@@ -0,0 +1,153 @@
+import asyncio
+
+import server
+
+from .conftest import ADMIN_PASSWORD, book
+
+
+def day_row(client, booking_date, barber_id="marius"):
+    response = client.get(
+        "/api/admin/utilization",
+        params={"start": booking_date, "end": booking_date, "barber_id": barber_id},
+        auth=("admin", ADMIN_PASSWORD),
+    )
+    assert response.status_code == 200
+    return response.json()["days"][0]
+
+
+def rollup_docs(db):
+    async def load():
+        return await db.utilization.find({}, {"_id": 0, "version": 0}).to_list(None)
+    docs = asyncio.run(load())
+    return sorted(docs, key=lambda d: (d["tenant_id"], d["barber_id"], d["date"]))
+
+
+def test_create_then_cancel_nets_to_zero(client, booking_date):
+    booking = book(client, booking_date).json()
+    row = day_row(client, booking_date)
+    assert (row["booked_minutes"], row["booked_slots"], row["revenue"]) == (45, 1, 300)
+
+    assert client.delete(f"/api/bookings/{booking['id']}").status_code == 200
+    row = day_row(client, booking_date)
+    assert (row["booked_minutes"], row["booked_slots"], row["revenue"]) == (0, 0, 0)
+    assert row["cancellations"] == 1
+
+
+def test_double_cancel_counts_once(client, booking_date):
+    booking = book(client, booking_date).json()
+
+    assert client.delete(f"/api/bookings/{booking['id']}").status_code == 200
+    assert client.delete(f"/api/bookings/{booking['id']}").status_code == 200
+    row = day_row(client, booking_date)
+    assert row["cancellations"] == 1
+    assert row["booked_slots"] == 0
+
+
+def test_absent_day_excluded_from_utilization(client, booking_date):
+    book(client, booking_date)
+    client.post("/api/admin/absence", json={"barber_id": "marius", "date": booking_date}, auth=("admin", ADMIN_PASSWORD))
+
+    row = day_row(client, booking_date)
+    assert row["available_minutes"] == 0
+    assert row["booked_minutes"] == 45
+    assert row["utilized_slots"] == 0
+    assert row["utilization"] == 0.0
+
+
+def test_utilization_counts_slots_not_minutes(client, booking_date):
+    # A 60 minute service still occupies a single 45 minute slot.
+    book(client, booking_date, service_id="fade-skjegg", service_price=400, service_duration=60)
+
+    row = day_row(client, booking_date)
+    assert row["booked_minutes"] == 60
+    assert row["utilization"] == round(1 / row["total_slots"], 4)
+
+
+def test_booking_rejects_negative_price_and_huge_duration(client, booking_date):
+    assert book(client, booking_date, service_price=-5).status_code == 422
+    assert book(client, booking_date, service_duration=2000).status_code == 422
+
+
+def test_rebuild_matches_incremental_rollups(client, db, booking_date):
+    first = book(client, booking_date).json()
+    book(client, booking_date, time_slot="09:45", service_id="skjegg", service_price=150, service_duration=20)
+    book(client, booking_date, "sivert", "16:00")
+    client.delete(f"/api/bookings/{first['id']}")
+    client.post("/api/admin/absence", json={"barber_id": "sivert", "date": booking_date}, auth=("admin", ADMIN_PASSWORD))
+    incremental = rollup_docs(db)
+
+    asyncio.run(server.rebuild_utilization())
+    assert rollup_docs(db) == incremental
+
+
+def test_rebuild_removes_stale_rollups(db):
+    asyncio.run(server.bump_utilization("westcutz", "marius", "2030-01-01", booked_minutes=45, booked_slots=1))
+
+    asyncio.run(server.rebuild_utilization())
+    assert rollup_docs(db) == []
+
+
+def test_rebuild_backfills_legacy_bookings(db):
+    asyncio.run(db.bookings.insert_one({
+        "id": "legacy", "barber_id": "marius", "date": "2024-05-01", "time_slot": "09:00",
+        "service_price": 300, "service_duration": 45, "status": "confirmed",
+    }))
+
+    asyncio.run(server.rebuild_utilization())
+    [doc] = rollup_docs(db)
+    assert doc["tenant_id"] == "westcutz"
+    assert (doc["booked_minutes"], doc["booked_slots"], doc["revenue"]) == (45, 1, 300)
+
+
+def test_rebuild_keeps_concurrent_increment(db, monkeypatch):
+    compute = server.compute_utilization
+    calls = []
+
+    async def compute_then_book(match):
+        rollups = await compute(match)
+        if not calls:
+            # A booking lands after the recount but before the rollup is written.
+            await db.bookings.insert_one({
+                "id": "late", "tenant_id": "westcutz", "barber_id": "marius", "date": "2030-01-01",
+                "time_slot": "09:00", "service_price": 300, "service_duration": 45, "status": "confirmed",
+            })
+            await server.bump_utilization("westcutz", "marius", "2030-01-01", booked_minutes=45, booked_slots=1, revenue=300)
+        calls.append(match)
+        return rollups
+
+    monkeypatch.setattr(server, "compute_utilization", compute_then_book)
+    asyncio.run(db.bookings.insert_one({
+        "id": "early", "tenant_id": "westcutz", "barber_id": "marius", "date": "2030-01-01",
+        "time_slot": "09:45", "service_price": 300, "service_duration": 45, "status": "confirmed",
+    }))
+
+    asyncio.run(server.rebuild_utilization())
+    [doc] = rollup_docs(db)
+    assert (doc["booked_minutes"], doc["booked_slots"], doc["revenue"]) == (90, 2, 600)
+    assert len(calls) == 2
+
+
+def test_startup_seeds_rollups_once(db, monkeypatch):
+    # The db fixture already ran ensure_indexes, which claimed the seed marker.
+    calls = []
+
+    async def count_rebuilds(*args):
+        calls.append(args)
+        return 0
+
+    monkeypatch.setattr(server, "rebuild_utilization", count_rebuilds)
+    asyncio.run(server.ensure_indexes())
+
+    assert calls == []
+    assert asyncio.run(db.migrations.find_one({"_id": "utilization_seed"}))["finished_at"]
+
+
+def test_utilization_accepts_unpadded_dates(client):
+    asyncio.run(server.bump_utilization("westcutz", "marius", "2030-01-05", booked_minutes=45, booked_slots=1))
+
+    response = client.get(
+        "/api/admin/utilization",
+        params={"start": "2030-1-5", "end": "2030-1-5", "barber_id": "marius"},
+        auth=("admin", ADMIN_PASSWORD),
+    )
+    assert response.json()["days"][0]["booked_slots"] == 1